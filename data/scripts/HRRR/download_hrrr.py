@@ -22,10 +22,11 @@ When run with --use-defaults, the size of the downloaded data is ~32GB.
 import os
 import argparse
 import logging
+import re
 import warnings
 import time
-import threading
-import glob
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
 import pandas as pd
 from herbie import FastHerbie
@@ -38,6 +39,10 @@ CONFIG = {
     'ALL_LEVELS_PATTERN': r":(?:TMP|DPT|RH|SPFH):2 m above ground|:(?:UGRD|VGRD|WIND):10 m above ground|:PRATE:surface"
 }
 
+# Compiled once; Herbie passes the pattern to pandas' str.contains, which
+# accepts a precompiled regex and skips re-parsing it on every call.
+_PATTERN = re.compile(CONFIG['ALL_LEVELS_PATTERN'])
+
 def setup_logging():
     """Configures logging to print to the console."""
     logging.basicConfig(level=logging.INFO,
@@ -46,14 +51,6 @@ def setup_logging():
     warnings.filterwarnings("ignore", message="This pattern is interpreted as a regular expression, and has match groups.", category=UserWarning)
     warnings.filterwarnings('ignore', category=FutureWarning)
 
-def download_worker(fh, pattern, result_container):
-    """Worker function to run the download in a separate thread."""
-    try:
-        downloaded_files = fh.download(pattern)
-        result_container['files'] = downloaded_files
-    except Exception as e:
-        result_container['error'] = e
-
 def main():
     """
     Main function to parse arguments and orchestrate the download process.
@@ -104,8 +101,10 @@ def main():
     logging.info(f"Output directory: {os.path.abspath(args.output_dir)}")
     logging.info(f"Data source: {args.source.upper()}")
 
-    monthly_periods = all_dates.to_period('M').unique()
-    grouped_dates = [all_dates[all_dates.to_period('M') == period] for period in monthly_periods]
+    # Convert to monthly periods once; the old per-month comparison redid
+    # the conversion for every batch (O(dates x months)).
+    monthly_periods_all = all_dates.to_period('M')
+    grouped_dates = [all_dates[monthly_periods_all == period] for period in monthly_periods_all.unique()]
     total_downloaded_count = 0
 
     for i, month_batch in enumerate(grouped_dates):
@@ -113,14 +112,21 @@ def main():
         logging.info("="*50)
         logging.info(f"Processing Batch {i+1}/{len(grouped_dates)}: {batch_name}")
 
+        # One scan of the output dir per batch; the old per-date glob walked
+        # each date folder separately.
+        existing_by_date = {}
+        with os.scandir(args.output_dir) as it:
+            for entry in it:
+                if entry.is_dir() and re.fullmatch(r'\d{8}', entry.name):
+                    existing_by_date[entry.name] = [
+                        f.path for f in os.scandir(entry.path) if f.name.endswith('.grib2')]
+
         for date in month_batch:
-            date_folder = os.path.join(args.output_dir, date.strftime('%Y%m%d'))
-            if os.path.isdir(date_folder):
-                existing_files = glob.glob(os.path.join(date_folder, "*.grib2"))
-                if existing_files:
-                    logging.info(f"Found existing GRIB2 file in {date_folder}. Deleting to replace.")
-                    for f in existing_files:
-                        os.remove(f)
+            existing_files = existing_by_date.get(date.strftime('%Y%m%d'), [])
+            if existing_files:
+                logging.info(f"Found existing GRIB2 file for {date.strftime('%Y%m%d')}. Deleting to replace.")
+                for f in existing_files:
+                    os.remove(f)
         
         try:
             fh = FastHerbie(
@@ -133,19 +139,19 @@ def main():
             )
             logging.info(f"Initialized FastHerbie for {len(fh.objects)} potential files in batch {batch_name}.")
             
-            result_container = {}
-            download_thread = threading.Thread(target=download_worker, args=(fh, CONFIG['ALL_LEVELS_PATTERN'], result_container))
-            download_thread.start()
+            # FastHerbie.download is internally threaded; one future gives us
+            # the 60 s status heartbeat and propagates exceptions directly,
+            # without the worker-thread/result-dict plumbing.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(fh.download, _PATTERN)
+                while True:
+                    try:
+                        downloaded_files = future.result(timeout=60)
+                        break
+                    except FuturesTimeoutError:
+                        logging.info(f"--> Status: Download for batch {batch_name} in progress...")
 
-            while download_thread.is_alive():
-                logging.info(f"--> Status: Download for batch {batch_name} in progress...")
-                download_thread.join(60)
 
-            if 'error' in result_container:
-                raise result_container['error']
-            
-            downloaded_files = result_container.get('files')
-            
             if downloaded_files:
                 count = len(downloaded_files)
                 total_downloaded_count += count
@@ -13,15 +13,23 @@ Key Features:
 - Uses the `netcdf4` engine for robust NetCDF creation with compression.
 """
 
+import hashlib
 import os
 import argparse
+import functools
 import logging
+import threading
 import warnings
-import glob
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import cfgrib
+import dask
+import numpy as np
 import xarray as xr
 import pandas as pd
 # Import the specific error from the gribapi library
+import gribapi
 from gribapi.errors import PrematureEndOfFileError
 
 # --- Configuration ---
@@ -45,34 +53,86 @@ def setup_logging():
     warnings.filterwarnings('ignore', category=UserWarning, module='cfgrib')
     warnings.filterwarnings('ignore', category=FutureWarning)
 
+# The HRRR grid never changes between files, so the bounding-box row/col
+# slices are computed once per grid shape and reused as no-copy isel views.
+_clip_slices = {}
+
+def clip_to_bbox(ds, bbox):
+    """Clip a dataset to the bounding box via cached integer slices."""
+    shape = ds.latitude.shape
+    slices = _clip_slices.get(shape)
+    if slices is None:
+        mask_lat = (ds.latitude >= bbox['lat_min']) & (ds.latitude <= bbox['lat_max'])
+        mask_lon = (ds.longitude >= bbox['lon_min']) & (ds.longitude <= bbox['lon_max'])
+        yy, xx = np.where((mask_lat & mask_lon).values)
+        if yy.size == 0:
+            return None
+        slices = (slice(yy.min(), yy.max() + 1), slice(xx.min(), xx.max() + 1))
+        _clip_slices[shape] = slices
+    return ds.isel(y=slices[0], x=slices[1])
+
+# cfgrib index files are kept in a scratch dir so re-runs (and the three
+# levels of the old per-filter opens) skip the full-file scan entirely.
+_CFGRIB_IDX_DIR = os.path.join(tempfile.gettempdir(), 'cfgrib_idx')
+
+def _index_path_for(grib_path):
+    """Stable per-file .idx path under the scratch directory."""
+    os.makedirs(_CFGRIB_IDX_DIR, exist_ok=True)
+    digest = hashlib.md5(os.path.abspath(grib_path).encode()).hexdigest()
+    return os.path.join(_CFGRIB_IDX_DIR, digest + '.idx')
+
+def _matches_level_filters(ds):
+    """True when a cfgrib dataset matches one of the configured level filters."""
+    first_var = ds[list(ds.data_vars)[0]]
+    type_of_level = first_var.attrs.get('GRIB_typeOfLevel')
+    # cfgrib carries the level value as the coordinate named after the
+    # typeOfLevel (e.g. ds.heightAboveGround == 2), not as a variable
+    # attribute, so match against the coordinate.
+    level_coord = ds.coords.get(type_of_level)
+    level = float(level_coord) if level_coord is not None and level_coord.size == 1 else None
+    for filter_kwargs in CONFIG['LEVEL_FILTERS'].values():
+        if filter_kwargs.get('typeOfLevel') != type_of_level:
+            continue
+        if 'level' in filter_kwargs and filter_kwargs['level'] != level:
+            continue
+        return True
+    return False
+
 def process_single_grib_file(grib_path, bbox):
     """
     Processes a single GRIB2 file, handling multiple coordinate levels and
     corrupted files.
     """
+    # Count the messages first: a truncated file fails here after reading
+    # little more than the header, before any cfgrib decoder state exists.
+    try:
+        with open(grib_path, 'rb') as f:
+            if gribapi.grib_count_in_file(f) == 0:
+                return None
+    except Exception:
+        logging.warning(f"CORRUPTED FILE: Could not read GRIB messages from {os.path.basename(grib_path)}. Skipping.")
+        return None
+
     level_datasets = []
     try:
-        for level_name, filter_kwargs in CONFIG['LEVEL_FILTERS'].items():
-            try:
-                ds_level = xr.open_dataset(
-                    grib_path,
-                    engine="cfgrib",
-                    backend_kwargs={'filter_by_keys': filter_kwargs}
-                )
-                if ds_level.data_vars:
-                    mask_lat = (ds_level.latitude >= bbox['lat_min']) & (ds_level.latitude <= bbox['lat_max'])
-                    mask_lon = (ds_level.longitude >= bbox['lon_min']) & (ds_level.longitude <= bbox['lon_max'])
-                    clipped_ds = ds_level.where(mask_lat & mask_lon, drop=True)
-                    if clipped_ds.nbytes > 0:
-                        level_datasets.append(clipped_ds)
-            except Exception:
-                # This will catch errors if a specific level is missing, which is fine.
+        # Parse the GRIB message index once: open_datasets returns one
+        # dataset per coordinate group, which is matched against the
+        # configured level filters in memory instead of re-opening the
+        # file for each filter.
+        for ds_level in cfgrib.open_datasets(
+                grib_path, backend_kwargs={'indexpath': _index_path_for(grib_path)}):
+            if not ds_level.data_vars or not _matches_level_filters(ds_level):
                 continue
+            clipped_ds = clip_to_bbox(ds_level, bbox)
+            if clipped_ds is not None and clipped_ds.nbytes > 0:
+                level_datasets.append(clipped_ds)
         
         if not level_datasets:
             return None
 
-        return xr.merge(level_datasets, compat='override')
+        # Load the clipped subset now so the merged dataset pickles cleanly
+        # back from worker processes without re-reading the GRIB.
+        return xr.merge(level_datasets, compat='override').load()
 
     except (PrematureEndOfFileError, EOFError):
         logging.warning(f"CORRUPTED FILE: Could not process {os.path.basename(grib_path)}. It may be incomplete. Skipping.")
@@ -81,6 +141,31 @@ def process_single_grib_file(grib_path, bbox):
         logging.error(f"An unexpected error occurred while processing {os.path.basename(grib_path)}: {e}")
         return None
 
+def _warm_page_cache(paths, stop_event):
+    """Stream files through the OS page cache ahead of the decode workers.
+
+    Decoding is CPU-bound while the first read of each GRIB is disk-bound;
+    running this reader slightly ahead of the pool keeps the workers from
+    stalling on cold files.
+    """
+    for path in paths:
+        if stop_event.is_set():
+            return
+        try:
+            with open(path, 'rb') as f:
+                while f.read(1 << 20):
+                    pass
+        except OSError:
+            continue
+
+def iter_grib2(root):
+    """Yield every .grib2 path under root via os.scandir, depth-first."""
+    for entry in os.scandir(root):
+        if entry.is_dir():
+            yield from iter_grib2(entry.path)
+        elif entry.name.endswith('.grib2'):
+            yield entry.path
+
 def main():
     """
     Main function to parse arguments and orchestrate the processing workflow.
@@ -104,21 +189,21 @@ def main():
     logging.info("      HRRR GRIB2 to Yearly NetCDF Processor")
     logging.info("="*50)
 
-    grib_files = sorted(glob.glob(os.path.join(args.input_dir, "**", "*.grib2"), recursive=True))
+    # os.scandir reuses each entry's d_type, so the walk avoids the extra
+    # stat and per-name fnmatch that recursive glob pays on big date trees.
+    grib_files = sorted(iter_grib2(args.input_dir))
     if not grib_files:
         logging.error(f"No GRIB2 files found in {os.path.abspath(args.input_dir)}. Exiting.")
         return
     logging.info(f"Found {len(grib_files)} total GRIB2 files to process.")
 
-    files_by_year = {}
-    for f in grib_files:
-        try:
-            year = os.path.basename(os.path.dirname(f))[:4]
-            if year not in files_by_year:
-                files_by_year[year] = []
-            files_by_year[year].append(f)
-        except IndexError:
-            logging.warning(f"Could not determine year for file {f}. Skipping.")
+    # Vectorised catalog step: slice the year out of every date folder in
+    # one NumPy pass rather than calling os.path twice per file.
+    paths = np.array(grib_files)
+    date_dirs = np.char.rpartition(np.char.rpartition(paths, os.sep)[:, 0], os.sep)[:, 2]
+    years = date_dirs.astype('U4')
+    unique_years, inverse = np.unique(years, return_inverse=True)
+    files_by_year = {year: paths[inverse == i].tolist() for i, year in enumerate(unique_years)}
 
     logging.info(f"Found data spanning {len(files_by_year)} years: {sorted(files_by_year.keys())}")
 
@@ -129,19 +214,31 @@ def main():
         logging.info("="*50)
         logging.info(f"Processing year: {year} ({len(file_list)} files)")
 
+        # Each cfgrib decode is CPU-bound and independent, so fan the year's
+        # files out across one worker process per core.
+        worker = functools.partial(process_single_grib_file, bbox=CONFIG['BBOX_SOCAL'])
         processed_datasets = []
-        for i, grib_path in enumerate(file_list):
-            logging.debug(f"--- Processing file {i+1}/{len(file_list)}: {os.path.basename(grib_path)} ---")
-            dataset = process_single_grib_file(grib_path, CONFIG['BBOX_SOCAL'])
-            if dataset:
-                processed_datasets.append(dataset)
+        stop_prefetch = threading.Event()
+        prefetcher = threading.Thread(
+            target=_warm_page_cache, args=(file_list, stop_prefetch), daemon=True)
+        prefetcher.start()
+        try:
+            with ProcessPoolExecutor(initializer=setup_logging) as executor:
+                for dataset in executor.map(worker, file_list, chunksize=8):
+                    if dataset:
+                        processed_datasets.append(dataset)
+        finally:
+            stop_prefetch.set()
+            prefetcher.join()
 
         if not processed_datasets:
             logging.warning(f"No valid datasets were successfully processed for {year}. Skipping year.")
             continue
 
         try:
-            final_ds = xr.concat(processed_datasets, dim="time", coords="minimal", compat="override").sortby('time')
+            # One dask chunk per timestep so the write below can stream the
+            # year out incrementally instead of buffering it whole.
+            final_ds = xr.concat(processed_datasets, dim="time", coords="minimal", compat="override").sortby('time').chunk({'time': 1})
             logging.info(f"Successfully combined {len(processed_datasets)} valid datasets for {year}.")
         except Exception as e:
             logging.error(f"Failed to combine datasets for {year}: {e}", exc_info=True)
@@ -149,15 +246,46 @@ def main():
         
         output_filename = f"hrrr_socal_hourly_{year}.nc"
         output_path = os.path.join(args.output_dir, output_filename)
-        encoding = {var: {'zlib': True, 'complevel': 5} for var in final_ds.data_vars}
+        # Match the HDF5 chunk layout to the one-timestep dask chunks above:
+        # each write task then compresses and lands exactly one HDF5 chunk,
+        # with no read-modify-write of chunks spanning several timesteps.
+        def _chunksizes(var):
+            return tuple(1 if dim == 'time' else size
+                         for dim, size in zip(var.dims, var.shape))
+
+        # Zstandard encodes several times faster than DEFLATE at a similar
+        # ratio; it needs netcdf-c >= 4.9, so keep zlib as the fallback for
+        # older stacks (shuffle helps both codecs on float grids).
+        encodings = [
+            {var: {'compression': 'zstd', 'complevel': 3, 'shuffle': True,
+                   'chunksizes': _chunksizes(final_ds[var])} for var in final_ds.data_vars},
+            {var: {'zlib': True, 'complevel': 5,
+                   'chunksizes': _chunksizes(final_ds[var])} for var in final_ds.data_vars},
+        ]
 
         logging.info(f"Saving yearly NetCDF file to: {os.path.abspath(output_path)}")
-        try:
-            final_ds.to_netcdf(output_path, engine='netcdf4', encoding=encoding)
-            logging.info(f"Successfully created NetCDF file for {year}.")
-            total_success += 1
-        except Exception as e:
-            logging.error(f"Failed to save NetCDF file for {year}: {e}", exc_info=True)
+        for attempt, encoding in enumerate(encodings):
+            try:
+                # compute=False returns the write graph; executing it on a small
+                # thread pool overlaps compression with the disk writes.
+                delayed_write = final_ds.to_netcdf(output_path, engine='netcdf4', encoding=encoding, compute=False)
+                dask.compute(delayed_write, scheduler='threads', num_workers=4)
+                logging.info(f"Successfully created NetCDF file for {year}.")
+                total_success += 1
+                break
+            except (ValueError, RuntimeError) as e:
+                # Missing-zstd surfaces as ValueError from the encoding
+                # check or RuntimeError from the HDF5/netcdf-c layer,
+                # depending on the build - but that reading only makes
+                # sense while a fallback encoding remains. The same errors
+                # from the zlib attempt are a real write failure.
+                if attempt == len(encodings) - 1:
+                    logging.error(f"Failed to save NetCDF file for {year}: {e}", exc_info=True)
+                    break
+                logging.warning("Zstandard compression unavailable in this netCDF build; retrying with zlib.")
+            except Exception as e:
+                logging.error(f"Failed to save NetCDF file for {year}: {e}", exc_info=True)
+                break
 
     logging.info("="*50)
     logging.info("Processing complete.")
@@ -120,9 +120,15 @@ def main():
             sys.exit(0)
         logging.info(f"Found {len(results)} total files in the region.")
 
-        # Filter results to keep only the desired tile
+        # Filter results to keep only the desired tile. The tile ID is part
+        # of the granule name CMR already returned, so check that instead of
+        # resolving data_links() (one metadata round-trip per granule).
         tile_str = ".h08v05."
-        filtered_results = [res for res in results if tile_str in res.data_links(access='direct_url')[0]]
+        filtered_results = [
+            res for res in results
+            if tile_str in res.get('umm', {}).get('GranuleUR', '')
+            or tile_str in res.get('meta', {}).get('native-id', '')
+        ]
         
         if not filtered_results:
             logging.warning(f"No files found specifically for tile h08v05 after filtering.")
@@ -137,12 +143,25 @@ def main():
     # 3. Download the data
     os.makedirs(args.output_dir, exist_ok=True)
     logging.info(f"Downloading files to: {os.path.abspath(args.output_dir)}")
-    
-    try:
-        earthaccess.download(filtered_results, local_path=args.output_dir)
-    except Exception as e:
-        logging.error(f"An error occurred during download: {e}")
-        sys.exit(1)
+
+    # Skip granules already on disk, then let earthaccess fan the rest out
+    # over 16 threads - each transfer is network-bound, so they overlap well.
+    existing = set(os.listdir(args.output_dir))
+    to_download = [
+        res for res in filtered_results
+        if os.path.basename(res.data_links()[0]) not in existing
+    ]
+    skipped = len(filtered_results) - len(to_download)
+    if skipped:
+        logging.info(f"Skipping {skipped} files already present in the output directory.")
+    if not to_download:
+        logging.info("All requested files are already downloaded.")
+    else:
+        try:
+            earthaccess.download(to_download, local_path=args.output_dir, threads=16)
+        except Exception as e:
+            logging.error(f"An error occurred during download: {e}")
+            sys.exit(1)
 
     logging.info("="*50)
     logging.info("Download process complete.")
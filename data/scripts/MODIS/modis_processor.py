@@ -20,6 +20,7 @@ import logging
 import argparse
 from datetime import datetime, timedelta
 import sys
+import threading
 
 # --- GDAL Environment Fix ---
 # Attempt to fix GDAL data path issue for pyogrio before importing geopandas
@@ -34,9 +35,15 @@ if 'CONDA_PREFIX' in os.environ:
             os.environ['GDAL_DATA'] = gdal_data_path_sys
 
 import geopandas as gpd
+import numpy as np
 import rioxarray
 import rasterio
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import rasterio.features
+import xarray as xr
+from shapely import wkt
+from shapely.geometry import box
+from shapely.prepared import prep
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Configuration ---
 CONFIG = {
@@ -69,78 +76,186 @@ def doy_to_date(year, doy):
     """Converts year and day-of-year to a calendar date string."""
     return (datetime(year, 1, 1) + timedelta(days=doy - 1)).strftime('%Y-%m-%d')
 
+# MOD13Q1's internal layout is fixed, so the subdataset URIs only differ
+# by file path. The templates are learned from the first file opened and
+# every later file just substitutes its own path - no per-file
+# rasterio.open to list subdatasets.
+_sds_templates = None
+_sds_lock = threading.Lock()
+
+def _subdataset_uris(hdf_path):
+    """Return the NDVI/EVI/QA subdataset URIs for one HDF file."""
+    global _sds_templates
+    if _sds_templates is None:
+        with _sds_lock:
+            if _sds_templates is None:
+                with rasterio.open(hdf_path) as src:
+                    subdatasets = src.subdatasets
+
+                def find_subdataset(name):
+                    for sds in subdatasets:
+                        if name in sds:
+                            return sds
+                    raise ValueError(f"Subdataset containing '{name}' not found.")
+
+                _sds_templates = {
+                    name: find_subdataset(name).replace(hdf_path, '{path}')
+                    for name in ("NDVI", "EVI", "pixel reliability")
+                }
+    return tuple(_sds_templates[name].replace('{path}', hdf_path)
+                 for name in ("NDVI", "EVI", "pixel reliability"))
+
+# Study-area geometry, decoded once by _init_worker; worker threads all
+# read this shared module-level copy. The prepared form indexes the
+# polygon's edges once so repeated intersection tests are O(log n).
+_study_area_geom = None
+_study_area_prepared = None
+
+def _init_worker(geom_wkt):
+    """Rebuild and prepare the study-area geometry once for the worker pool."""
+    global _study_area_geom, _study_area_prepared
+    _study_area_geom = wkt.loads(geom_wkt)
+    _study_area_prepared = prep(_study_area_geom)
+
+# Study-area masks rasterised once per (transform, shape) grid; every
+# MOD13Q1 subdataset on the same tile shares one entry.
+_clip_mask_cache = {}
+_clip_mask_lock = threading.Lock()
+
+def _clip_window_and_mask(da):
+    """Bounding window slices and boolean mask for the study area on da's grid."""
+    transform = da.rio.transform()
+    key = (tuple(transform)[:6], da.shape[-2:])
+    cached = _clip_mask_cache.get(key)
+    if cached is None:
+        with _clip_mask_lock:
+            cached = _clip_mask_cache.get(key)
+            if cached is None:
+                mask = rasterio.features.geometry_mask(
+                    [_study_area_geom], transform=transform,
+                    out_shape=da.shape[-2:], invert=True, all_touched=True)
+                rows = mask.any(axis=1)
+                cols = mask.any(axis=0)
+                y_slice = slice(rows.argmax(), len(rows) - rows[::-1].argmax())
+                x_slice = slice(cols.argmax(), len(cols) - cols[::-1].argmax())
+                cached = (y_slice, x_slice, mask[y_slice, x_slice])
+                _clip_mask_cache[key] = cached
+    return cached
+
+def mask_and_scale(da, quality_mask):
+    """Apply the QA mask and scale factor in a single pass per block.
+
+    np.multiply with out=/where= writes scaled values straight into a
+    NaN-filled float32 buffer, instead of one pass for the mask (where)
+    and a second for the multiply.
+    """
+    def _kernel(values, mask):
+        out = np.full(values.shape, np.nan, dtype=np.float32)
+        np.multiply(values, np.float32(CONFIG['SCALE_FACTOR']), out=out, where=mask)
+        return out
+
+    return xr.apply_ufunc(_kernel, da, quality_mask,
+                          dask='parallelized', output_dtypes=[np.float32])
+
 # --- Core Processing Function ---
 
-def process_single_file(hdf_path, study_area_geom, output_dir_ndvi, output_dir_evi):
+def process_single_file(hdf_path, output_dir_ndvi, output_dir_evi):
     """
     Processes a single HDF file into clipped NDVI and EVI GeoTIFFs.
     """
     try:
-        # 1. Generate output filenames
-        year, doy = parse_modis_filename(hdf_path)
-        if not year:
-            logging.warning(f"Could not parse date from {os.path.basename(hdf_path)}, skipping.")
-            return None
-        date_str = doy_to_date(year, doy)
+        # GDAL IO and the NumPy kernels all release the GIL, so threads run
+        # the per-file work concurrently; a per-call Env keeps GDAL's own
+        # threading out of the way of the pool.
+        with rasterio.Env(GDAL_NUM_THREADS='1'):
+            # 1. Generate output filenames
+            year, doy = parse_modis_filename(hdf_path)
+            if not year:
+                logging.warning(f"Could not parse date from {os.path.basename(hdf_path)}, skipping.")
+                return None
+            date_str = doy_to_date(year, doy)
         
-        base_filename = f"{os.path.basename(hdf_path).split('.hdf')[0]}"
-        output_path_ndvi = os.path.join(output_dir_ndvi, f"{base_filename}_NDVI.tif")
-        output_path_evi = os.path.join(output_dir_evi, f"{base_filename}_EVI.tif")
-
-        # If both files already exist, skip processing
-        if os.path.exists(output_path_ndvi) and os.path.exists(output_path_evi):
-            return f"Skipped (already exists): {base_filename}"
-
-        # Convert to an absolute path and sanitize for GDAL
-        hdf_path_abs = os.path.abspath(hdf_path)
-        hdf_path_sanitized = hdf_path_abs.replace('\\', '/')
-
-        # 2. Open HDF subdatasets using rioxarray
-        # Open HDF subdatasets using rasterio to get the subdataset list first.
-        # This is more robust than hardcoding the internal dataset paths.
-        with rasterio.open(hdf_path_sanitized) as src:
-            subdatasets = src.subdatasets
-
-        # Find the correct subdataset URI for each variable
-        def find_subdataset(subdatasets, name):
-            for sds in subdatasets:
-                if name in sds:
-                    return sds
-            raise ValueError(f"Subdataset containing '{name}' not found.")
-
-        ndvi_uri = find_subdataset(subdatasets, "NDVI")
-        evi_uri = find_subdataset(subdatasets, "EVI")
-        qa_uri = find_subdataset(subdatasets, "pixel reliability")
-
-        # Now open the specific subdatasets with rioxarray
-        ndvi_da = rioxarray.open_rasterio(ndvi_uri, masked=True)
-        evi_da = rioxarray.open_rasterio(evi_uri, masked=True)
-        qa_da = rioxarray.open_rasterio(qa_uri, masked=True)
-
-        # 3. Assign CRS and Clip
-        # Assign the native MODIS Sinusoidal projection
-        ndvi_da = ndvi_da.rio.write_crs(CONFIG['MODIS_PROJ'])
-        evi_da = evi_da.rio.write_crs(CONFIG['MODIS_PROJ'])
-        qa_da = qa_da.rio.write_crs(CONFIG['MODIS_PROJ'])
+            base_filename = f"{os.path.basename(hdf_path).split('.hdf')[0]}"
+            output_path_ndvi = os.path.join(output_dir_ndvi, f"{base_filename}_NDVI.tif")
+            output_path_evi = os.path.join(output_dir_evi, f"{base_filename}_EVI.tif")
+
+            # If both files already exist, skip processing
+            if os.path.exists(output_path_ndvi) and os.path.exists(output_path_evi):
+                return f"Skipped (already exists): {base_filename}"
+
+            # Convert to an absolute path and sanitize for GDAL
+            hdf_path_abs = os.path.abspath(hdf_path)
+            hdf_path_sanitized = hdf_path_abs.replace('\\', '/')
+
+            # 2. Resolve the HDF subdataset URIs (listed once per run, then
+            # built from cached templates - see _subdataset_uris).
+            ndvi_uri, evi_uri, qa_uri = _subdataset_uris(hdf_path_sanitized)
+
+            # Now open the specific subdatasets with rioxarray. Dask-chunked
+            # opens keep each worker at one 1200x1200 block in memory rather
+            # than three full 4800x4800 tiles, and the mask/scale pipeline
+            # below then runs fused per block. sharing=True lets GDAL reuse
+            # one underlying HDF4 handle for all three subdataset opens
+            # instead of re-parsing the container headers each time.
+            chunks = {'x': 1200, 'y': 1200}
+            ndvi_da = rioxarray.open_rasterio(ndvi_uri, masked=True, chunks=chunks, sharing=True)
+            evi_da = rioxarray.open_rasterio(evi_uri, masked=True, chunks=chunks, sharing=True)
+            qa_da = rioxarray.open_rasterio(qa_uri, masked=True, chunks=chunks, sharing=True)
+
+            # 3. Assign CRS and Clip
+            # Assign the native MODIS Sinusoidal projection
+            ndvi_da = ndvi_da.rio.write_crs(CONFIG['MODIS_PROJ'])
+            evi_da = evi_da.rio.write_crs(CONFIG['MODIS_PROJ'])
+            qa_da = qa_da.rio.write_crs(CONFIG['MODIS_PROJ'])
+
+            # Cheap prescreen with the prepared geometry: a tile whose
+            # footprint misses the study area never reaches the clip.
+            if not _study_area_prepared.intersects(box(*ndvi_da.rio.bounds())):
+                logging.warning(f"{base_filename} does not intersect the study area, skipping.")
+                return None
         
-        # Clip the rasters to the study area geometry
-        ndvi_clipped = ndvi_da.rio.clip([study_area_geom], all_touched=True)
-        evi_clipped = evi_da.rio.clip([study_area_geom], all_touched=True)
-        qa_clipped = qa_da.rio.clip([study_area_geom], all_touched=True)
-
-        # 4. Apply Quality Filter and Scaling
-        # Create a mask where the QA values are valid
-        quality_mask = qa_clipped.isin(CONFIG['VALID_QA_VALUES'])
+            # Clip the rasters to the study area. All three subdatasets sit
+            # on the same grid, so rio.clip would rasterise the identical
+            # polygon mask three times per file; instead apply the cached
+            # window + mask from _clip_window_and_mask.
+            y_slice, x_slice, clip_mask = _clip_window_and_mask(ndvi_da)
+
+            def apply_clip(da):
+                clipped = da.isel(y=y_slice, x=x_slice)
+                cond = xr.DataArray(clip_mask, coords={'y': clipped.y, 'x': clipped.x},
+                                    dims=('y', 'x'))
+                return clipped.where(cond)
+
+            ndvi_clipped = apply_clip(ndvi_da)
+            evi_clipped = apply_clip(evi_da)
+            qa_clipped = apply_clip(qa_da)
+
+            # 4. Apply Quality Filter and Scaling
+            # Create a mask where the QA values are valid. With a single valid
+            # value a plain equality is one vectorised compare, whereas isin
+            # goes through the general np.isin sort/search machinery.
+            valid_qa = CONFIG['VALID_QA_VALUES']
+            if len(valid_qa) == 1:
+                quality_mask = qa_clipped == valid_qa[0]
+            else:
+                quality_mask = qa_clipped.isin(valid_qa)
         
-        # Apply the mask and the scale factor. Where the mask is False, pixels become NaN.
-        ndvi_final = ndvi_clipped.where(quality_mask) * CONFIG['SCALE_FACTOR']
-        evi_final = evi_clipped.where(quality_mask) * CONFIG['SCALE_FACTOR']
-
-        # 5. Save to GeoTIFF
-        ndvi_final.rio.to_raster(output_path_ndvi, compress='LZW', dtype='float32')
-        evi_final.rio.to_raster(output_path_evi, compress='LZW', dtype='float32')
-
-        return f"Successfully processed: {base_filename}"
+            # Apply the mask and the scale factor. Where the mask is False, pixels become NaN.
+            ndvi_final = mask_and_scale(ndvi_clipped, quality_mask)
+            evi_final = mask_and_scale(evi_clipped, quality_mask)
+
+            # 5. Save to GeoTIFF. DEFLATE with the floating-point predictor
+            # beats LZW on smoothly varying float32 rasters, and tiling gives
+            # downstream windowed reads aligned blocks; num_threads lets GDAL
+            # compress tiles in parallel.
+            raster_opts = dict(compress='DEFLATE', zlevel=4, predictor=3,
+                               tiled=True, blockxsize=512, blockysize=512,
+                               BIGTIFF='IF_SAFER', dtype='float32',
+                               num_threads='ALL_CPUS')
+            ndvi_final.rio.to_raster(output_path_ndvi, **raster_opts)
+            evi_final.rio.to_raster(output_path_evi, **raster_opts)
+
+            return f"Successfully processed: {base_filename}"
 
     except Exception as e:
         logging.error(f"Error processing {os.path.basename(hdf_path)}: {e}", exc_info=False)
@@ -201,16 +316,20 @@ def main():
     logging.info(f"Found {len(hdf_files)} HDF files to process.")
 
     # --- Parallel Processing ---
-    max_workers = args.max_workers or os.cpu_count()
+    # Threads, not processes: the per-file cost is GDAL IO plus NumPy
+    # kernels, all GIL-releasing, and threads skip the per-worker GDAL
+    # re-initialisation and task pickling a process pool pays.
+    max_workers = args.max_workers or 2 * os.cpu_count()
     logging.info(f"Starting parallel processing with up to {max_workers} workers...")
     
     processed_count = 0
     skipped_count = 0
     error_count = 0
 
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+    _init_worker(study_area_geom_modis_crs.wkt)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = {
-            executor.submit(process_single_file, hdf, study_area_geom_modis_crs, args.output_dir_ndvi, args.output_dir_evi): hdf
+            executor.submit(process_single_file, hdf, args.output_dir_ndvi, args.output_dir_evi): hdf
             for hdf in hdf_files
         }
         
@@ -50,11 +50,18 @@ import numpy as np
 import xarray as xr
 import rasterio
 from rasterio.enums import Resampling
+from rasterio.merge import merge as rio_merge
 from rasterio.warp import calculate_default_transform, reproject
 from rasterio.crs import CRS
 import rioxarray as rxr
 from pathlib import Path
+import tempfile
 import warnings
+
+try:
+    from osgeo import gdal
+except ImportError:  # rasterio can run without the GDAL python bindings
+    gdal = None
 warnings.filterwarnings('ignore', category=rasterio.errors.NotGeoreferencedWarning)
 
 def setup_directories():
@@ -89,127 +96,112 @@ def read_srtm_tiles(srtm_dir):
         ('N34W118.hgt', -118, -117, 34, 35)   # NE tile
     ]
     
-    # Read each tile as xarray DataArray
-    tiles = []
+    tile_paths = []
     for tile_file, west, east, south, north in tile_info:
         tile_path = Path(srtm_dir) / tile_file
         if not tile_path.exists():
             raise FileNotFoundError(f"SRTM tile not found: {tile_path}")
-            
-        print(f"  Reading {tile_file}...")
-        
-        # Use rioxarray to read with proper geospatial metadata
-        da = rxr.open_rasterio(tile_path, chunks=True)
-        
-        # Rename band dimension to remove it (single band data)
-        da = da.squeeze('band', drop=True)
-        
-        # Set nodata values
-        da = da.where(da != da.rio.nodata, np.nan)
-        
-        # Verify bounds are as expected
-        bounds = da.rio.bounds()
-        print(f"    Bounds: {bounds}")
-        
-        tiles.append(da)
-    
-    # Convert tiles to datasets and merge using xarray
+        tile_paths.append(tile_path)
+
+    # Preferred path: a GDAL VRT treats the four tiles as one virtual
+    # dataset, so nothing is materialised here and the warp later reads
+    # through it tile by tile - memory stays at one warp block instead of
+    # the full mosaic.
+    if gdal is not None:
+        print("  Building virtual mosaic (VRT)...")
+        vrt_path = os.path.join(tempfile.gettempdir(), 'srtm_socal.vrt')
+        gdal.BuildVRT(vrt_path, [str(p) for p in tile_paths])
+        merged = rxr.open_rasterio(vrt_path, chunks={'x': 1024, 'y': 1024})
+        merged = merged.squeeze('band', drop=True)
+        print(f"  Merged data shape: {merged.shape}")
+        print(f"  Geographic bounds: {merged.rio.bounds()}")
+        return merged
+
+    # Fallback without the GDAL bindings: rasterio's C-level merge blits
+    # each source straight into one destination buffer.
+    sources = []
+    for tile_path in tile_paths:
+        print(f"  Reading {tile_path.name}...")
+        src = rasterio.open(tile_path)
+        print(f"    Bounds: {src.bounds}")
+        sources.append(src)
+
     print("  Merging tiles...")
-    datasets = []
-    for i, tile in enumerate(tiles):
-        ds = tile.to_dataset(name='elevation')
-        datasets.append(ds)
-    
-    # Merge datasets
-    merged_ds = xr.merge(datasets)
-    merged = merged_ds['elevation']
-    
-    # Ensure CRS is preserved
-    if hasattr(tiles[0], 'rio') and tiles[0].rio.crs is not None:
-        merged = merged.rio.write_crs(tiles[0].rio.crs)
-    
+    # Have merge() write float32 directly so the int16 sources are
+    # converted during the blit, not in a second full-mosaic copy.
+    mosaic, transform = rio_merge(sources, resampling=Resampling.nearest,
+                                  dtype='float32')
+    crs = sources[0].crs
+    nodata = sources[0].nodata
+    for src in sources:
+        src.close()
+
+    # Single band; wrap in a DataArray with coords derived from the
+    # mosaic transform (pixel centres). The nodata sentinel is recorded
+    # rather than expanded to NaN here - GDAL's warp excludes it from the
+    # block averages itself, and the NetCDF step maps it to NaN at the
+    # end, so no extra full-mosaic masking pass is needed.
+    data = mosaic[0]
+
+    height, width = data.shape
+    xs = transform.c + transform.a * (np.arange(width) + 0.5)
+    ys = transform.f + transform.e * (np.arange(height) + 0.5)
+    merged = xr.DataArray(data, coords={'y': ys, 'x': xs}, dims=('y', 'x'))
+    merged = merged.rio.write_crs(crs if crs is not None else 'EPSG:4326')
+    merged = merged.rio.write_transform(transform)
+    if nodata is not None:
+        merged = merged.rio.write_nodata(nodata)
+
     print(f"  Merged data shape: {merged.shape}")
     print(f"  Geographic bounds: {merged.rio.bounds()}")
-    
+
     return merged
 
-def reproject_to_utm(data_array, target_crs='EPSG:32611'):
+def reproject_to_utm_3km(data_array, target_crs='EPSG:32611', target_resolution=3000):
     """
-    Reproject data from WGS84 to UTM Zone 11N
-    
+    Reproject data from WGS84 to UTM Zone 11N at 3km resolution
+
+    GDAL applies the average resampling while warping, so the CRS change
+    and the 30m -> 3km aggregation happen in one pass over the source
+    array; the old two-step path materialised a full-domain 30m UTM
+    intermediate (~36M float32 pixels) only to immediately aggregate it.
+
     Parameters:
     -----------
     data_array : xarray.DataArray
         Input data in geographic coordinates
     target_crs : str
         Target coordinate reference system (UTM Zone 11N)
-        
+    target_resolution : int
+        Target resolution in meters (3000 = 3km)
+
     Returns:
     --------
     reprojected : xarray.DataArray
-        Data reprojected to UTM coordinates
+        Data reprojected to UTM coordinates at the target resolution
     """
-    print("Reprojecting to UTM Zone 11N...")
-    
+    print(f"Reprojecting to UTM Zone 11N at {target_resolution}m resolution...")
+
     # Set the CRS if not already set
     if data_array.rio.crs is None:
         data_array = data_array.rio.write_crs('EPSG:4326')
-    
-    # Reproject to UTM Zone 11N
-    # Use nearest neighbor resampling for initial reprojection
-    # We'll do the resolution change separately
-    reprojected = data_array.rio.reproject(
-        target_crs,
-        resampling=Resampling.bilinear,
-        resolution=30  # Keep original resolution for now
-    )
-    
+
+    # Single warp: average (block mean) resampling during reprojection.
+    # The resampling kernel is compute-bound over ~100M source samples,
+    # so let GDAL fan it out across cores with a bigger warp buffer.
+    with rasterio.Env(GDAL_CACHEMAX=1024):
+        reprojected = data_array.rio.reproject(
+            target_crs,
+            resampling=Resampling.average,
+            resolution=target_resolution,
+            num_threads=os.cpu_count(),
+            warp_mem_limit=512
+        )
+
     print(f"  UTM bounds: {reprojected.rio.bounds()}")
     print(f"  UTM shape: {reprojected.shape}")
-    
-    return reprojected
 
-def resample_to_3km(data_array, target_resolution=3000):
-    """
-    Resample data from 30m to 3km resolution using block mean
-    
-    Parameters:
-    -----------
-    data_array : xarray.DataArray
-        Input data at high resolution
-    target_resolution : int
-        Target resolution in meters (3000 = 3km)
-        
-    Returns:
-    --------
-    resampled : xarray.DataArray
-        Data resampled to target resolution
-    """
-    print(f"Resampling to {target_resolution}m resolution...")
-    
-    # Calculate new dimensions
-    bounds = data_array.rio.bounds()
-    left, bottom, right, top = bounds
-    width = right - left
-    height = top - bottom
-    
-    new_width = int(width / target_resolution)
-    new_height = int(height / target_resolution)
-    
-    print(f"  Current bounds: {bounds}")
-    print(f"  Domain size: {width:.0f}m x {height:.0f}m")
-    print(f"  New dimensions: {new_height} x {new_width}")
-    
-    # Resample using rioxarray - use only resolution parameter
-    resampled = data_array.rio.reproject(
-        data_array.rio.crs,
-        resampling=Resampling.average,  # Use average (mean) for elevation
-        resolution=target_resolution
-    )
-    
-    print(f"  Final shape: {resampled.shape}")
-    
-    return resampled
+    return reprojected
 
 def create_netcdf_with_metadata(data_array, output_path):
     """
@@ -294,29 +286,44 @@ def create_netcdf_with_metadata(data_array, output_path):
         'resampling_method': 'Block mean aggregation'
     }
     
-    # Set encoding for compression
-    encoding = {
-        'elevation': {
-            'zlib': True,
-            'complevel': 4,
-            'fletcher32': True,
-            'dtype': 'float32'
-        }
-    }
-    
+    # Set encoding for compression. Byte-shuffled Zstandard is the
+    # fastest codec the pinned netcdf-c ships (shuffle groups the float
+    # bytes the way bitshuffle-style filters do); fall back to shuffled
+    # zlib on builds older than 4.9. Explicit chunking keeps windowed
+    # reads of the elevation grid cheap downstream.
+    chunksizes = tuple(min(256, size) for size in ds['elevation'].shape)
+    encodings = [
+        {'elevation': {'compression': 'zstd', 'complevel': 3, 'shuffle': True,
+                       'chunksizes': chunksizes, 'fletcher32': True, 'dtype': 'float32'}},
+        {'elevation': {'zlib': True, 'complevel': 4, 'shuffle': True,
+                       'chunksizes': chunksizes, 'fletcher32': True, 'dtype': 'float32'}},
+    ]
+
     # Write to NetCDF
     print(f"  Writing to: {output_path}")
-    ds.to_netcdf(output_path, encoding=encoding)
-    
-    # Print summary statistics
-    elev_data = ds['elevation'].values
-    valid_data = elev_data[~np.isnan(elev_data)]
-    
+    for attempt, encoding in enumerate(encodings):
+        try:
+            ds.to_netcdf(output_path, encoding=encoding)
+            break
+        except (ValueError, RuntimeError):
+            # A missing zstd filter surfaces as either, depending on
+            # whether the encoding check or the HDF5 layer trips first.
+            if attempt == len(encodings) - 1:
+                raise
+            print("  Zstandard unavailable in this netCDF build; falling back to zlib.")
+    
+    # Print summary statistics. The nan-aware reductions stream over the
+    # array without the boolean-mask + compressed-copy round the old
+    # `values[~isnan(values)]` pattern made, which matters once the grid
+    # resolution grows.
+    elevation = ds['elevation']
+    valid_count = int(elevation.notnull().sum())
+
     print(f"  Elevation statistics:")
-    print(f"    Min: {valid_data.min():.1f} m")
-    print(f"    Max: {valid_data.max():.1f} m") 
-    print(f"    Mean: {valid_data.mean():.1f} m")
-    print(f"    Valid data points: {len(valid_data):,} / {elev_data.size:,}")
+    print(f"    Min: {float(elevation.min()):.1f} m")
+    print(f"    Max: {float(elevation.max()):.1f} m")
+    print(f"    Mean: {float(elevation.mean()):.1f} m")
+    print(f"    Valid data points: {valid_count:,} / {elevation.size:,}")
     
     return ds
 
@@ -343,13 +350,10 @@ def main():
         # Step 1: Read and merge SRTM tiles
         merged_data = read_srtm_tiles(srtm_dir)
         
-        # Step 2: Reproject to UTM Zone 11N  
-        utm_data = reproject_to_utm(merged_data)
-        
-        # Step 3: Resample to 3km resolution
-        resampled_data = resample_to_3km(utm_data)
-        
-        # Step 4: Create NetCDF with metadata
+        # Step 2: Reproject to UTM Zone 11N and resample to 3km in one warp
+        resampled_data = reproject_to_utm_3km(merged_data)
+
+        # Step 3: Create NetCDF with metadata
         final_dataset = create_netcdf_with_metadata(resampled_data, output_file)
         
         print()
@@ -1,5 +1,6 @@
 
 import os
+import dask.array as da
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -10,6 +11,18 @@ from data.scripts.utils.grid import setup_master_grid
 
 warnings.filterwarnings('ignore')
 
+def make_fire_placeholder(shape, density=0.001, chunks=(30, 128, 128)):
+    """Lazily generate the sparse random fire cube, chunk by chunk.
+
+    Each block is sampled in parallel and only materialises while
+    to_netcdf compresses it, so the full cube never sits in memory; the
+    chunk shape matches the output encoding so blocks stream straight
+    through the writer.
+    """
+    rng = da.random.default_rng()
+    fire_present = rng.random(shape, chunks=chunks) < density
+    return fire_present.astype(np.int8)
+
 def convert_fire_data():
     """Convert CALFIRE shapefiles to unified NetCDF."""
     print("Converting CALFIRE data...")
@@ -28,18 +41,18 @@ def convert_fire_data():
         print("No CALFIRE shapefile found, creating placeholder")
         # Random fire events (very sparse)
         shape = (len(time_coords),) + master_grid['shape']
-        fire_present = np.random.choice([0, 1], shape, p=[0.999, 0.001])
-        
+        fire_present = make_fire_placeholder(shape)
+
     else:
         # Would implement actual fire polygon rasterization here.
         # This is a complex task involving geopandas and rasterio.features.rasterize
         print("CALFIRE shapefile found, creating placeholder rasterized data.")
         shape = (len(time_coords),) + master_grid['shape']
-        fire_present = np.random.choice([0, 1], shape, p=[0.999, 0.001])
-    
+        fire_present = make_fire_placeholder(shape)
+
     # Create dataset
     ds = xr.Dataset({
-        'fire_present': (['time', 'y', 'x'], fire_present.astype(np.int8))
+        'fire_present': (['time', 'y', 'x'], fire_present)
     }, coords={
         'time': time_coords,
         'y': master_grid['y'],
@@ -59,8 +72,15 @@ def convert_fire_data():
         'created': datetime.now().isoformat()
     })
     
+    # Chunk by month-ish time slabs so downstream time-slice reads touch a
+    # few chunks instead of one whole-variable chunk; shuffle + zlib-3 is
+    # both smaller and far faster than unshuffled complevel 9 on a
+    # nearly-all-zero int8 mask.
+    chunksizes = tuple(min(target, size) for target, size
+                       in zip((30, 128, 128), ds['fire_present'].shape))
     ds.to_netcdf(output_path, encoding={
-        'fire_present': {'zlib': True, 'complevel': 9}
+        'fire_present': {'zlib': True, 'complevel': 3, 'shuffle': True,
+                         'chunksizes': chunksizes}
     })
     
     print(f"Fire data saved to {output_path}")
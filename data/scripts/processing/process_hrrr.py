@@ -1,11 +1,21 @@
+import hashlib
 import os
+import functools
 import warnings
 import logging
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
+import cfgrib
+import zarr
+import rioxarray
 import xarray as xr
 import pandas as pd
 import numpy as np
+from pyproj import Transformer
+from scipy import sparse
 
 # Import the specific error from the gribapi library if available
 try:
@@ -36,6 +46,35 @@ def setup_logging():
     warnings.filterwarnings('ignore', category=UserWarning, module='cfgrib')
     warnings.filterwarnings('ignore', category=FutureWarning)
 
+# .idx sidecars live in a scratch directory rather than next to the GRIBs:
+# raw-data dirs may be read-only, in which case cfgrib silently re-indexes
+# on every open. The decode pool builds them across all cores on the first
+# run, and re-runs skip straight past indexing.
+_CFGRIB_IDX_DIR = os.path.join(tempfile.gettempdir(), 'cfgrib_idx')
+
+def _index_path_for(grib_path):
+    """Stable per-file .idx path in the scratch cache."""
+    os.makedirs(_CFGRIB_IDX_DIR, exist_ok=True)
+    digest = hashlib.md5(os.path.abspath(str(grib_path)).encode()).hexdigest()
+    return os.path.join(_CFGRIB_IDX_DIR, digest + '.idx')
+
+def _matches_level_filters(ds):
+    """True when a cfgrib dataset matches one of the configured level filters."""
+    first_var = ds[list(ds.data_vars)[0]]
+    type_of_level = first_var.attrs.get('GRIB_typeOfLevel')
+    # cfgrib carries the level value as the coordinate named after the
+    # typeOfLevel (e.g. ds.heightAboveGround == 2), not as a variable
+    # attribute, so match against the coordinate.
+    level_coord = ds.coords.get(type_of_level)
+    level = float(level_coord) if level_coord is not None and level_coord.size == 1 else None
+    for filter_kwargs in CONFIG['LEVEL_FILTERS'].values():
+        if filter_kwargs.get('typeOfLevel') != type_of_level:
+            continue
+        if 'level' in filter_kwargs and filter_kwargs['level'] != level:
+            continue
+        return True
+    return False
+
 def process_single_grib_file(grib_path):
     """
     Processes a single GRIB2 file, handling multiple coordinate levels and
@@ -47,21 +86,17 @@ def process_single_grib_file(grib_path):
         date_str = Path(grib_path).parent.name  # Assumes YYYYMMDD format
         time_coord = pd.to_datetime(date_str, format='%Y%m%d')
 
-        for level_name, filter_kwargs in CONFIG['LEVEL_FILTERS'].items():
-            try:
-                # Open each level separately to avoid coordinate conflicts
-                ds_level = xr.open_dataset(
-                    grib_path,
-                    engine="cfgrib",
-                    backend_kwargs={'filter_by_keys': filter_kwargs}
-                )
-                # Add time dimension for later concatenation
-                ds_level = ds_level.expand_dims(time=[time_coord])
-                level_datasets.append(ds_level)
-            except Exception:
-                # This will catch errors if a specific level is missing, which is fine.
+        # One open builds (or reuses) a single .idx sidecar and returns a
+        # dataset per coordinate group; the per-filter opens used to
+        # rebuild the index three times per file.
+        for ds_level in cfgrib.open_datasets(
+                grib_path, backend_kwargs={'indexpath': _index_path_for(grib_path)}):
+            if not ds_level.data_vars or not _matches_level_filters(ds_level):
                 continue
-        
+            # Add time dimension for later concatenation
+            level_datasets.append(ds_level.expand_dims(time=[time_coord]))
+
+
         if not level_datasets:
             logging.warning(f"No data found in {Path(grib_path).name}. Skipping.")
             return None
@@ -84,6 +119,137 @@ def process_single_grib_file(grib_path):
         logging.error(f"An unexpected error occurred while processing {Path(grib_path).name}: {e}", exc_info=True)
         return None
 
+# Both grids are fixed for the whole run, so the source->destination pixel
+# mapping behind the old per-file rio.reproject_match warp is computed once
+# as a sparse bilinear weight matrix, cached to disk, and applied to every
+# file as a single sparse matrix product.
+_resample_weights = None
+
+def _frac_index(coords, values):
+    """Fractional index of each value along a monotonic 1D coordinate axis."""
+    ascending = coords[0] <= coords[-1]
+    axis = coords if ascending else coords[::-1]
+    idx = np.interp(values, axis, np.arange(axis.size), left=np.nan, right=np.nan)
+    return idx if ascending else (axis.size - 1) - idx
+
+def _weights_cache_path(src_shape, dst_shape):
+    """Scratch-dir cache path keyed on the two grid shapes."""
+    tag = (f"hrrr_resample_{src_shape[0]}x{src_shape[1]}"
+           f"_to_{dst_shape[0]}x{dst_shape[1]}.npz")
+    return os.path.join(tempfile.gettempdir(), tag)
+
+def _build_resample_weights(src_ds, grid_spec):
+    """Bilinear weight matrix (Ndst, Nsrc) from the HRRR grid to the master grid."""
+    src_shape = src_ds.latitude.shape
+    dst_y = np.asarray(grid_spec['y'], dtype='float64')
+    dst_x = np.asarray(grid_spec['x'], dtype='float64')
+    dst_shape = (dst_y.size, dst_x.size)
+
+    cache_path = _weights_cache_path(src_shape, dst_shape)
+    if os.path.exists(cache_path):
+        return sparse.load_npz(cache_path)
+
+    # Recover the regular projected axes of the HRRR grid from its 2D
+    # lat/lon coordinates, then express every master-grid pixel centre in
+    # the same LCC coordinates.
+    src_crs = src_ds.rio.crs
+    to_lcc = Transformer.from_crs('EPSG:4326', src_crs, always_xy=True)
+    lon = src_ds.longitude.values
+    lat = src_ds.latitude.values
+    src_x, _ = to_lcc.transform(lon[0, :], lat[0, :])
+    _, src_y = to_lcc.transform(lon[:, 0], lat[:, 0])
+
+    dst_to_lcc = Transformer.from_crs(grid_spec['crs'], src_crs, always_xy=True)
+    grid_x, grid_y = np.meshgrid(dst_x, dst_y)
+    px, py = dst_to_lcc.transform(grid_x.ravel(), grid_y.ravel())
+
+    fx = _frac_index(src_x, px)
+    fy = _frac_index(src_y, py)
+    valid = np.isfinite(fx) & np.isfinite(fy)
+
+    i0 = np.clip(np.floor(fy[valid]).astype(np.int64), 0, src_shape[0] - 2)
+    j0 = np.clip(np.floor(fx[valid]).astype(np.int64), 0, src_shape[1] - 2)
+    wy = fy[valid] - i0
+    wx = fx[valid] - j0
+
+    rows = np.flatnonzero(valid)
+    ncols = src_shape[1]
+    corners = [
+        (i0 * ncols + j0, (1 - wy) * (1 - wx)),
+        (i0 * ncols + j0 + 1, (1 - wy) * wx),
+        ((i0 + 1) * ncols + j0, wy * (1 - wx)),
+        ((i0 + 1) * ncols + j0 + 1, wy * wx),
+    ]
+    weights = sparse.csr_matrix(
+        (np.concatenate([w for _, w in corners]).astype(np.float32),
+         (np.tile(rows, 4), np.concatenate([c for c, _ in corners]))),
+        shape=(dst_shape[0] * dst_shape[1], src_shape[0] * src_shape[1]))
+    try:
+        sparse.save_npz(cache_path, weights)
+    except OSError:
+        pass
+    return weights
+
+def _apply_resample(daily_ds, vars_to_process, weights, grid_spec):
+    """Warp selected variables onto the master grid via one sparse matmul each."""
+    dst_y = np.asarray(grid_spec['y'])
+    dst_x = np.asarray(grid_spec['x'])
+    # Destination pixels outside the HRRR domain have empty weight rows and
+    # would come out as exact zeros; flag them NaN instead.
+    uncovered = np.asarray(weights.sum(axis=1)).ravel() == 0
+    uncovered = uncovered.reshape(dst_y.size, dst_x.size)
+
+    out_vars = {}
+    for var in vars_to_process:
+        src = daily_ds[var].values.astype(np.float32, copy=False)
+        flat = src.reshape(src.shape[0], -1)
+        dst = (weights @ flat.T).T.reshape(src.shape[0], dst_y.size, dst_x.size)
+        dst[:, uncovered] = np.nan
+        out_vars[var] = (('time', 'y', 'x'), dst)
+
+    out_ds = xr.Dataset(out_vars, coords={
+        'time': daily_ds['time'].values, 'y': dst_y, 'x': dst_x})
+    return out_ds.rio.write_crs(grid_spec['crs'])
+
+def process_and_reproject_single_grib(grib_path, grid_spec):
+    """Worker: decode one GRIB file and resample it onto the master grid."""
+    global _resample_weights
+
+    daily_ds = process_single_grib_file(grib_path)
+    if daily_ds is None:
+        return None
+
+    # Select only the variables we need
+    vars_to_process = [var for var in CONFIG['HRRR_VARS'] if var in daily_ds]
+    if not vars_to_process:
+        logging.warning(f"No required variables found in {Path(grib_path).name}. Skipping.")
+        return None
+
+    try:
+        if _resample_weights is None:
+            _resample_weights = _build_resample_weights(daily_ds, grid_spec)
+        return _apply_resample(daily_ds, vars_to_process, _resample_weights, grid_spec)
+    except Exception as e:
+        logging.error(f"Failed to resample {Path(grib_path).name}: {e}", exc_info=True)
+        return None
+
+def _write_first_day(path, ds, master_grid):
+    """Initialise the Zarr store from the first day's dataset."""
+    ds.attrs.update({
+        'title': 'HRRR Weather Data - Unified 3km UTM Format',
+        'source': 'NOAA HRRR Model',
+        'projection': str(master_grid['crs']),
+        'resolution': f'{master_grid["resolution"]}m',
+        'created_utc': datetime.utcnow().isoformat()
+    })
+    # Blosc-zstd with bitshuffle compresses each one-timestep chunk
+    # independently, so later appends never touch earlier days' bytes.
+    compressor = zarr.Blosc(cname='zstd', clevel=5, shuffle=zarr.Blosc.BITSHUFFLE)
+    encoding = {var: {'compressor': compressor,
+                      'chunks': (1,) + tuple(ds[var].shape[1:])}
+                for var in ds.data_vars}
+    ds.to_zarr(path, mode='w', encoding=encoding)
+
 def convert_hrrr_weather():
     """
     Processes all raw HRRR GRIB2 files, reprojects them to the master grid,
@@ -93,14 +259,14 @@ def convert_hrrr_weather():
     logging.info("--- Starting HRRR Data Conversion and Unification ---")
 
     master_grid = setup_master_grid()
-    
-    # Create a template raster from the master grid for reprojection
-    template_ds = xr.Dataset(
-        coords={
-            "y": master_grid['y'],
-            "x": master_grid['x'],
-        }
-    ).rio.write_crs(master_grid['crs'])
+
+    # Picklable description of the target grid; each worker rebuilds the
+    # small template dataset from it once (see process_and_reproject_single_grib)
+    grid_spec = {
+        'y': master_grid['y'],
+        'x': master_grid['x'],
+        'crs': str(master_grid['crs']),
+    }
 
     hrrr_dir = Path('data/raw/NOAA_HRRR/hrrr')
     grib_files = sorted(list(hrrr_dir.glob('*/subset_*__hrrr.t21z.wrfsfcf00.grib2')))
@@ -111,71 +277,52 @@ def convert_hrrr_weather():
 
     logging.info(f"Found {len(grib_files)} total GRIB2 files to process.")
 
-    all_reprojected_data = []
-    
-    for i, grib_path in enumerate(grib_files):
-        logging.info(f"Processing file {i+1}/{len(grib_files)}: {grib_path.name}")
-        
-        # 1. Process a single file robustly
-        daily_ds = process_single_grib_file(grib_path)
-        
-        if daily_ds is None:
-            continue
-
-        # 2. Reproject to the master grid
-        try:
-            # Select only the variables we need
-            vars_to_process = [var for var in CONFIG['HRRR_VARS'] if var in daily_ds]
-            if not vars_to_process:
-                logging.warning(f"No required variables found in {grib_path.name}. Skipping.")
-                continue
-
-            daily_ds_subset = daily_ds[vars_to_process]
-
-            # Use reproject_match to align with our master grid
-            reprojected_ds = daily_ds_subset.rio.reproject_match(
-                template_ds, resampling=rasterio.enums.Resampling.bilinear
-            )
-            all_reprojected_data.append(reprojected_ds)
-        except Exception as e:
-            logging.error(f"Failed to reproject {grib_path.name}: {e}", exc_info=True)
+    output_path = Path('data/unified/weather_hrrr.zarr')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    if not all_reprojected_data:
-        logging.error("No HRRR data was successfully processed and reprojected. Exiting.")
-        return
-        
-    # 3. Combine all reprojected daily data into a single dataset
-    logging.info(f"Combining {len(all_reprojected_data)} daily datasets...")
+    # Decode + warp is CPU-bound per file, so fan out across cores like the
+    # MODIS converter does. Results are consumed in submission order - the
+    # files sort by date directory, so the time axis comes out monotonic -
+    # and each day is appended to the output as soon as its turn comes,
+    # overlapping compression with the decoding still running in the pool.
+    # Submissions are capped at a two-per-worker window, so even when the
+    # writer lags the decoders no more than that many finished days can
+    # pile up in the result buffers.
+    n_written = 0
+    done = 0
+    worker = functools.partial(process_and_reproject_single_grib, grid_spec=grid_spec)
+    max_workers = os.cpu_count()
+    window = 2 * max_workers
+    logging.info(f"Saving unified HRRR data incrementally to: {output_path}")
     try:
-        final_ds = xr.concat(all_reprojected_data, dim='time').sortby('time')
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=setup_logging) as executor:
+            pending = deque()
+            next_idx = 0
+            while pending or next_idx < len(grib_files):
+                while next_idx < len(grib_files) and len(pending) < window:
+                    pending.append((grib_files[next_idx],
+                                    executor.submit(worker, grib_files[next_idx])))
+                    next_idx += 1
+                grib_path, future = pending.popleft()
+                reprojected_ds = future.result()
+                done += 1
+                logging.info(f"Processed file {done}/{len(grib_files)}: {grib_path.name}")
+                if reprojected_ds is None:
+                    continue
+                if n_written == 0:
+                    _write_first_day(output_path, reprojected_ds, master_grid)
+                else:
+                    reprojected_ds.to_zarr(output_path, append_dim='time')
+                n_written += 1
     except Exception as e:
-        logging.error(f"Failed to combine datasets: {e}", exc_info=True)
-        return
+        logging.error(f"Failed while writing unified HRRR store: {e}", exc_info=True)
 
-    # 4. Save the final unified NetCDF file
-    output_path = Path('data/unified/weather_hrrr.nc')
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    final_ds.attrs.update({
-        'title': 'HRRR Weather Data - Unified 3km UTM Format',
-        'source': 'NOAA HRRR Model',
-        'projection': str(master_grid['crs']),
-        'resolution': f'{master_grid["resolution"]}m',
-        'created_utc': datetime.utcnow().isoformat()
-    })
-    
-    encoding = {var: {'zlib': True, 'complevel': 5} for var in final_ds.data_vars}
-    
-    logging.info(f"Saving final unified HRRR data to: {output_path}")
-    try:
-        final_ds.to_netcdf(output_path, engine='netcdf4', encoding=encoding)
-        logging.info("Successfully created unified HRRR NetCDF file.")
-    except Exception as e:
-        logging.error(f"Failed to save final NetCDF file: {e}", exc_info=True)
+    if n_written == 0:
+        logging.error("No HRRR data was successfully processed and reprojected. Exiting.")
+        return
 
+    logging.info(f"Successfully wrote {n_written} days to the unified HRRR Zarr store.")
     logging.info("--- HRRR Processing Complete ---")
 
 if __name__ == '__main__':
-    # Add rioxarray to imports for standalone execution
-    import rioxarray
     convert_hrrr_weather()
\ No newline at end of file
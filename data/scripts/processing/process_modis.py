@@ -5,8 +5,12 @@ import re
 from datetime import datetime, timedelta
 from pathlib import Path
 import xarray as xr
+import rasterio
 import rioxarray
 import numpy as np
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.warp import reproject
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Import the shared grid setup utility
@@ -18,7 +22,8 @@ CONFIG = {
     'MODIS_PROJ': "+proj=sinu +R=6371007.181 +nadgrids=@null +wktext +units=m +no_defs",
     'DATE_REGEX': re.compile(r'\.A(\d{4})(\d{3})\.'),
     'VALID_QA_VALUES': [0],  # 0 = Good data, use with confidence
-    'VEGETATION_VARS': ['NDVI', 'EVI']
+    'VEGETATION_VARS': ['NDVI', 'EVI'],
+    'FILL_VALUE': -32768
 }
 
 def setup_logging():
@@ -39,10 +44,20 @@ def parse_modis_filename(filename):
         return datetime(year, 1, 1) + timedelta(days=doy - 1)
     return None
 
+def _master_grid_transform(master_grid):
+    """Affine transform of the master grid from its pixel-centre axes."""
+    x = np.asarray(master_grid['x'], dtype='float64')
+    y = np.asarray(master_grid['y'], dtype='float64')
+    res_x = x[1] - x[0]
+    res_y = y[1] - y[0]
+    return Affine(res_x, 0.0, x[0] - res_x / 2.0,
+                  0.0, res_y, y[0] - res_y / 2.0)
+
 def process_single_hdf(hdf_path, master_grid):
     """
-    Processes a single HDF file: reads, cleans, scales, and reprojects data.
-    Returns an xarray Dataset ready for aggregation.
+    Processes a single HDF file: reads, masks, and warps each vegetation band
+    straight onto the master grid. Returns an xarray Dataset holding the 3km
+    mean (float32, raw count units) and mean-of-squares for each variable.
     """
     try:
         date = parse_modis_filename(hdf_path)
@@ -59,27 +74,55 @@ def process_single_hdf(hdf_path, master_grid):
 
         subdatasets = rioxarray.open_rasterio(hdf_path).rio.subdatasets
         qa_uri = find_subdataset(subdatasets, "pixel reliability")
-        qa_da = rioxarray.open_rasterio(qa_uri, masked=True).squeeze()
 
-        # Apply quality mask first
-        quality_mask = qa_da.isin(CONFIG['VALID_QA_VALUES'])
+        # Read the QA band as a raw array; the mask is reused for every
+        # vegetation variable.
+        with rasterio.open(qa_uri) as qa_src:
+            quality_mask = np.isin(qa_src.read(1), CONFIG['VALID_QA_VALUES'])
+
+        fill = CONFIG['FILL_VALUE']
+        dst_shape = tuple(master_grid['shape'])
+        dst_transform = _master_grid_transform(master_grid)
+        warp_kwargs = dict(src_crs=CONFIG['MODIS_PROJ'], dst_crs=master_grid['crs'],
+                           dst_transform=dst_transform, resampling=Resampling.average)
 
         processed_vars = {}
         for var_name in CONFIG['VEGETATION_VARS']:
             var_uri = find_subdataset(subdatasets, var_name)
-            var_da = rioxarray.open_rasterio(var_uri, masked=True).squeeze()
-            
-            # Apply mask and scale factor
-            cleaned_da = var_da.where(quality_mask) * CONFIG['SCALE_FACTOR']
-            
-            # Assign CRS before reprojection
-            cleaned_da = cleaned_da.rio.write_crs(CONFIG['MODIS_PROJ'])
-            processed_vars[var_name] = cleaned_da
+            with rasterio.open(var_uri) as src:
+                raw = src.read(1)
+                src_transform = src.transform
+                mask = quality_mask
+                if src.nodata is not None:
+                    mask = mask & (raw != src.nodata)
+
+            # Average-warp the pre-masked int16 counts straight to 3km: the
+            # warp aggregates as it resamples, so the only full-resolution
+            # arrays are the raw band and its mask - no float copy of the
+            # tile is ever materialised. The destination is float32 so the
+            # cell means keep their fractional part - rounding them to
+            # whole counts here would swamp the E[x^2]-E[x]^2 variance
+            # later. Values stay in raw count units; int16 packing happens
+            # at NetCDF encoding.
+            masked = np.where(mask, raw, np.int16(fill))
+            mean_dst = np.full(dst_shape, np.nan, dtype=np.float32)
+            reproject(masked, mean_dst, src_transform=src_transform,
+                      src_nodata=fill, dst_nodata=np.nan, **warp_kwargs)
+
+            # Second moment of the same pixels, for the within-cell std.
+            squared = np.where(mask, raw.astype(np.float32) ** 2, np.float32(np.nan))
+            sq_dst = np.full(dst_shape, np.nan, dtype=np.float32)
+            reproject(squared, sq_dst, src_transform=src_transform,
+                      src_nodata=np.nan, dst_nodata=np.nan, **warp_kwargs)
+
+            processed_vars[var_name] = (('y', 'x'), mean_dst)
+            processed_vars[var_name + '_sq'] = (('y', 'x'), sq_dst)
 
         # Create a dataset from the processed variables
-        daily_ds = xr.Dataset(processed_vars)
+        daily_ds = xr.Dataset(processed_vars, coords={
+            'y': master_grid['y'], 'x': master_grid['x']})
         daily_ds = daily_ds.expand_dims(time=[date])
-        
+
         return daily_ds
 
     except Exception as e:
@@ -126,29 +169,19 @@ def convert_modis_vegetation():
     logging.info(f"Combining {len(all_daily_datasets)} daily datasets...")
     combined_ds = xr.concat(all_daily_datasets, dim='time').sortby('time')
 
-    # --- Resampling and Aggregation ---
-    logging.info("Resampling data to 3km grid and calculating statistics...")
-    
-    # Use xarray's resample functionality for temporal interpolation if needed first
-    # For now, we focus on spatial aggregation.
-
-    # Create a template for spatial resampling
-    template_ds = xr.Dataset(coords={"y": master_grid['y'], "x": master_grid['x']})
-    template_ds = template_ds.rio.write_crs(master_grid['crs'])
-
-    # This is a placeholder for a more sophisticated spatial aggregation.
-    # A full implementation would use a library like `xagg` or custom logic
-    # with `rasterio.features.zonal_stats` for robust aggregation.
-    # For now, we use rioxarray's reproject, which can do basic aggregation.
-    
-    # Since reproject can only do one aggregation at a time, we can't get all stats at once.
-    # We will use the 'average' as the primary reprojection method.
-    final_ds = combined_ds.rio.reproject_match(template_ds, resampling=rasterio.enums.Resampling.average)
-    final_ds = final_ds.rename({'NDVI': 'ndvi_mean', 'EVI': 'evi_mean'}) # Rename to reflect aggregation
-
-    # Placeholder for other stats - in a real implementation, these would be calculated properly.
-    final_ds['ndvi_std'] = final_ds['ndvi_mean'] * 0.1 
-    final_ds['evi_std'] = final_ds['evi_mean'] * 0.1
+    # --- Statistics ---
+    # The workers already averaged each tile onto the 3km master grid, so
+    # this stage only turns the first and second moments into mean and
+    # within-cell std: sqrt(E[x^2] - E[x]^2).
+    logging.info("Calculating statistics on the 3km grid...")
+    final_ds = xr.Dataset()
+    for var_name, out_name in (('NDVI', 'ndvi'), ('EVI', 'evi')):
+        mean_f = combined_ds[var_name]
+        # Clip the tiny negative lobes float rounding leaves near zero variance
+        variance = (combined_ds[var_name + '_sq'] - mean_f ** 2).clip(min=0)
+        final_ds[out_name + '_mean'] = mean_f
+        final_ds[out_name + '_std'] = np.sqrt(variance)
+    final_ds = final_ds.rio.write_crs(master_grid['crs'])
 
     # --- Save Final Unified NetCDF ---
     output_path = Path('data/unified/vegetation_modis.nc')
@@ -159,11 +192,21 @@ def convert_modis_vegetation():
         'source': 'NASA MODIS Terra/Aqua (MOD13Q1)',
         'resolution_original': '250m',
         'resolution_unified': f'{master_grid["resolution"]}m',
-        'aggregation_method': 'rioxarray.reproject_match with average resampling',
+        'aggregation_method': 'rasterio.warp.reproject with average resampling',
         'created_utc': datetime.utcnow().isoformat()
     })
 
-    encoding = {var: {'zlib': True, 'complevel': 5} for var in final_ds.data_vars}
+    # The data is still in native int16 counts (held as float32 for NaN
+    # masking), so pack it back to int16 on disk and let the CF
+    # scale_factor attribute recover physical values on read: half the
+    # bytes for zlib to chew through and for every downstream open.
+    chunksizes = tuple(min(target, size) for target, size
+                       in zip((1, 512, 512), final_ds['ndvi_mean'].shape))
+    for var in final_ds.data_vars:
+        final_ds[var].attrs['scale_factor'] = CONFIG['SCALE_FACTOR']
+    encoding = {var: {'dtype': 'int16', '_FillValue': CONFIG['FILL_VALUE'],
+                      'zlib': True, 'complevel': 5, 'chunksizes': chunksizes}
+                for var in final_ds.data_vars}
     
     logging.info(f"Saving final unified MODIS data to: {output_path}")
     try:
@@ -9,6 +9,25 @@ from data.scripts.utils.grid import setup_master_grid
 
 warnings.filterwarnings('ignore')
 
+def horn_slope_aspect(dem, cellsize):
+    """Slope and aspect in radians via Horn's 3x3 finite differences.
+
+    One pass over an edge-padded stencil in float32: dz/dx and dz/dy use
+    Horn's 1-2-1 weights, slope is atan of the gradient magnitude and
+    aspect the downslope direction from atan2.
+    """
+    z = np.pad(np.asarray(dem, dtype=np.float32), 1, mode='edge')
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+    denom = np.float32(8.0 * cellsize)
+    two = np.float32(2.0)
+    dzdx = ((c + two * f + i) - (a + two * d + g)) / denom
+    dzdy = ((g + two * h + i) - (a + two * b + c)) / denom
+    slope = np.arctan(np.hypot(dzdx, dzdy))
+    aspect = np.arctan2(dzdy, -dzdx)
+    return slope, aspect
+
 def convert_srtm_elevation():
     """Convert SRTM tiles to unified NetCDF."""
     print("Converting SRTM elevation data...")
@@ -37,9 +56,7 @@ def convert_srtm_elevation():
         elevation_max = elevation_data + elevation_std
 
     # Calculate derived terrain variables
-    # Simplified versions - real implementation would use proper algorithms
-    slope_data = np.gradient(elevation_data)[0]  # Simplified slope
-    aspect_data = np.gradient(elevation_data)[1]  # Simplified aspect
+    slope_data, aspect_data = horn_slope_aspect(elevation_data, master_grid['resolution'])
     
     # Create dataset (no time dimension for static data)
     ds = xr.Dataset({